@@ -7,6 +7,7 @@ from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from ratelimit import RateLimiter
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -19,7 +20,10 @@ db = SQLAlchemy(model_class=Base)
 # create the app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+# Number of proxies in front of the app whose X-Forwarded-For is trusted; rate
+# limits key on the client address this yields, so use 0 if nothing proxies the app
+proxy_hops = int(os.environ.get("PROXY_FIX_X_FOR", "1"))
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
 # configure the database, relative to the app instance folder
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///vehicle_booking.db")
@@ -38,6 +42,12 @@ login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
+# Setup rate limiting and admission control
+app.config["RATELIMIT_STORAGE_URL"] = os.environ.get("RATELIMIT_STORAGE_URL")
+app.config["RATELIMIT_MAX_CONCURRENT"] = int(os.environ.get("RATELIMIT_MAX_CONCURRENT", "0"))
+limiter = RateLimiter()
+limiter.init_app(app)
+
 with app.app_context():
     # Import models for table creation
     import models  # noqa: F401
@@ -45,6 +55,10 @@ with app.app_context():
     # Create tables if they don't exist
     db.create_all()
     
+    # Bring tables from older versions up to date
+    from utils import upgrade_schema
+    upgrade_schema()
+    
     # Import and register routes
     from routes import register_routes
     register_routes(app)
@@ -1,7 +1,13 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, SelectField, FloatField, IntegerField, DateField, HiddenField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange, Optional
-from models import User
+from wtforms.validators import DataRequired, InputRequired, Email, EqualTo, Length, ValidationError, NumberRange, Optional
+from models import User, Depot
+from utils import MAX_SEARCH_RADIUS_KM
+
+
+def depot_choices(empty_label):
+    """Build select choices for depots, with 0 meaning no depot"""
+    return [(0, empty_label)] + [(depot.id, depot.name) for depot in Depot.query.order_by(Depot.name).all()]
 
 
 class RegistrationForm(FlaskForm):
@@ -46,9 +52,23 @@ class VehicleForm(FlaskForm):
     is_available = BooleanField('Available for Booking')
     description = TextAreaField('Description', validators=[Optional(), Length(max=1000)])
     features = TextAreaField('Features (comma-separated)', validators=[Optional(), Length(max=500)])
+    depot_id = SelectField('Depot', coerce=int, validators=[Optional()])
     submit = SubmitField('Save Vehicle')
 
 
+class DepotForm(FlaskForm):
+    name = StringField('Name', validators=[DataRequired(), Length(max=64)])
+    address = StringField('Address', validators=[Optional(), Length(max=200)])
+    latitude = FloatField('Latitude', validators=[InputRequired(), NumberRange(min=-90, max=90)])
+    longitude = FloatField('Longitude', validators=[InputRequired(), NumberRange(min=-180, max=180)])
+    submit = SubmitField('Save Depot')
+
+    def validate_name(self, name):
+        depot = Depot.query.filter_by(name=name.data).first()
+        if depot:
+            raise ValidationError('A depot with this name already exists.')
+
+
 class BookingForm(FlaskForm):
     vehicle_id = HiddenField('Vehicle ID', validators=[DataRequired()])
     start_date = DateField('Start Date', validators=[DataRequired()], format='%Y-%m-%d')
@@ -57,6 +77,8 @@ class BookingForm(FlaskForm):
     card_holder = StringField('Card Holder Name', validators=[DataRequired(), Length(max=100)])
     expiry_date = StringField('Expiry Date (MM/YY)', validators=[DataRequired(), Length(min=5, max=5)])
     cvv = StringField('CVV', validators=[DataRequired(), Length(min=3, max=4)])
+    pickup_depot_id = SelectField('Pickup Depot', coerce=int, validators=[Optional()])
+    return_depot_id = SelectField('Return Depot', coerce=int, validators=[Optional()])
     notes = TextAreaField('Special Requests', validators=[Optional(), Length(max=500)])
     submit = SubmitField('Confirm Booking')
 
@@ -73,6 +95,9 @@ class SearchForm(FlaskForm):
     end_date = DateField('End Date', validators=[Optional()], format='%Y-%m-%d')
     max_price = FloatField('Max Daily Rate ($)', validators=[Optional(), NumberRange(min=0)])
     capacity = IntegerField('Min Capacity', validators=[Optional(), NumberRange(min=1)])
+    depot_id = SelectField('Near Depot', coerce=int, validators=[Optional()])
+    radius = FloatField('Within (km)', validators=[Optional(), NumberRange(min=0, max=MAX_SEARCH_RADIUS_KM,
+                                                                          message=f'Radius must be between 0 and {MAX_SEARCH_RADIUS_KM:,.0f} km.')])
     submit = SubmitField('Search')
 
 
@@ -1,37 +1,367 @@
+"""Build the deployment archive for the vehicle booking app.
+
+The archive is byte-for-byte reproducible: entries are sorted, every entry
+gets the same timestamp and normalised permissions, and file contents are
+streamed through zlib in chunks instead of being read into memory.
+
+Files are selected from the project tree, skipping anything matched by
+.gitignore, and limited to the patterns in deploy.manifest when it exists.
+Compression runs in parallel across cores, and compressed entries are cached
+in .build-cache/ keyed by content hash so unchanged files are not compressed
+again on the next build.
+"""
 import os
-import zipfile
+import sys
+import json
+import stat
+import struct
+import re
+import hashlib
+import tempfile
 import time
-from datetime import datetime
-
-def zipdir(path, ziph):
-    # ziph is zipfile handle
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            if file != 'vehicle_booking.zip' and '.git' not in root:  # Skip the zip file itself
-                try:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, path)
-                    # Use current time for all files to avoid timestamp issues
-                    zipinfo = zipfile.ZipInfo(arcname)
-                    # Use current time (ZIP format doesn't accept dates before 1980)
-                    current_time = time.localtime(time.time())[:6]
-                    zipinfo.date_time = current_time
-                    zipinfo.compress_type = zipfile.ZIP_DEFLATED
-                    
-                    # Read file data
-                    with open(file_path, 'rb') as f:
-                        data = f.read()
-                    
-                    # Write file to zip with controlled timestamp
-                    ziph.writestr(zipinfo, data)
-                except Exception as e:
-                    print(f"Error adding {file_path}: {e}")
+import argparse
+import zlib
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_OUTPUT = 'vehicle_booking.zip'
+DEFAULT_MANIFEST = 'deploy.manifest'
+CACHE_DIR = '.build-cache'
+# Unreferenced cached blobs are kept this long so other branches can reuse them
+CACHE_MAX_AGE = 7 * 24 * 3600
+BLOB_NAME = re.compile(r'[0-9a-f]{64}-[0-9]\Z')
+
+# Never shipped, whatever .gitignore or the manifest say
+ALWAYS_EXCLUDE = ['.git/', CACHE_DIR + '/', 'venv/', '.venv/', '*.db', '*.zip']
+
+# ZIP record layouts (see APPNOTE.TXT)
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+END_RECORD = struct.Struct('<4s4H2LH')
+ZIP_VERSION = 20
+ZIP_DEFLATED = 8
+UTF8_FLAG = 0x800
+UNIX_SYSTEM = 3
+
+
+def compile_pattern(pattern):
+    """Translate a gitignore glob to a regex: * and ? stop at /, ** crosses directories"""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += '[' + body.replace('\\', '\\\\') + ']'
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r'\Z')
+
+
+def parse_patterns(lines):
+    """Parse gitignore-style lines into (regex, negate, dir_only, anchored) tuples"""
+    patterns = []
+    for line in lines:
+        line = line.rstrip('\n').strip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        # A slash anywhere but the end anchors the pattern to the root
+        anchored = '/' in line
+        patterns.append((compile_pattern(line.lstrip('/')), negate, dir_only, anchored))
+    return patterns
+
+
+def read_patterns(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return parse_patterns(f)
+
+
+def pattern_matches(pattern, relpath, is_dir):
+    regex, negate, dir_only, anchored = pattern
+    if dir_only and not is_dir:
+        return False
+    # Patterns without a slash match the name at any depth
+    target = relpath if anchored else relpath.rsplit('/', 1)[-1]
+    return regex.match(target) is not None
+
+
+def matches(relpath, is_dir, patterns):
+    """Apply patterns in order, the last matching one wins"""
+    matched = False
+    for pattern in patterns:
+        if pattern_matches(pattern, relpath, is_dir):
+            matched = not pattern[1]
+    return matched
+
+
+def in_manifest(relpath, includes):
+    """Check a file against the include manifest; a matched directory includes everything below it"""
+    parts = relpath.split('/')
+    candidates = [('/'.join(parts[:i]), True) for i in range(1, len(parts))] + [(relpath, False)]
+
+    matched = False
+    for pattern in includes:
+        if any(pattern_matches(pattern, path, is_dir) for path, is_dir in candidates):
+            matched = not pattern[1]
+    return matched
+
+
+def collect_files(root, manifest_path, output):
+    """Return sorted archive names of the files to ship"""
+    # Fixed exclusions go last so a negated .gitignore line can't bring them back
+    ignores = read_patterns(os.path.join(root, '.gitignore')) + parse_patterns(ALWAYS_EXCLUDE)
+    includes = read_patterns(manifest_path) if manifest_path else []
+    output = os.path.relpath(os.path.abspath(output), root).replace(os.sep, '/')
+
+    files = []
+    for dirpath, dirs, filenames in os.walk(root):
+        reldir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        reldir = '' if reldir == '.' else reldir + '/'
+
+        # Prune ignored directories so we never walk venv/ and friends
+        dirs[:] = sorted(d for d in dirs if not matches(reldir + d, True, ignores))
+
+        for filename in filenames:
+            relpath = reldir + filename
+            if relpath == output or matches(relpath, False, ignores):
+                continue
+            if includes and not in_manifest(relpath, includes):
+                continue
+            if not os.path.isfile(os.path.join(root, relpath)):
+                continue
+            files.append(relpath)
+
+    return sorted(files)
+
+
+def hash_file(path):
+    """Stream a file, returning its SHA-256, CRC-32 and size"""
+    sha = hashlib.sha256()
+    crc = 0
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return sha.hexdigest(), crc, size
+
+
+def compress_file(path, blob_dir, level):
+    """Stream a file through deflate into the blob cache, returning its metadata"""
+    sha = hashlib.sha256()
+    crc = 0
+    size = 0
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    fd, tmp_path = tempfile.mkstemp(dir=blob_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out, open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                out.write(compressor.compress(chunk))
+            out.write(compressor.flush())
+            compress_size = out.tell()
+
+        digest = sha.hexdigest()
+        os.replace(tmp_path, os.path.join(blob_dir, f'{digest}-{level}'))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {'sha256': digest, 'crc': crc, 'size': size, 'compress_size': compress_size}
+
+
+def load_cache(cache_dir, level):
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('level') != level:
+        return {}
+    return cache.get('files', {})
+
+
+def save_cache(cache_dir, level, files):
+    path = os.path.join(cache_dir, 'manifest.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'level': level, 'files': files}, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def prepare_entries(root, files, cache_dir, level, jobs):
+    """Compress changed files in parallel and reuse cached blobs for the rest"""
+    blob_dir = os.path.join(cache_dir, 'blobs')
+    os.makedirs(blob_dir, exist_ok=True)
+    cached = load_cache(cache_dir, level)
+
+    entries = {}
+    pending = []
+    for relpath in files:
+        path = os.path.join(root, relpath)
+        st = os.stat(path)
+        previous = cached.get(relpath)
+
+        # Fast path: same size and mtime as last build
+        if (previous and previous['size'] == st.st_size and previous['mtime_ns'] == st.st_mtime_ns
+                and os.path.exists(os.path.join(blob_dir, f"{previous['sha256']}-{level}"))):
+            entries[relpath] = dict(previous, mode=st.st_mode)
+            continue
+
+        # Otherwise hash the content, which still finds the blob after a fresh
+        # checkout touches every mtime
+        digest, crc, size = hash_file(path)
+        blob = os.path.join(blob_dir, f'{digest}-{level}')
+        if os.path.exists(blob):
+            entries[relpath] = {'sha256': digest, 'crc': crc, 'size': size,
+                                'compress_size': os.path.getsize(blob),
+                                'mtime_ns': st.st_mtime_ns, 'mode': st.st_mode}
+        else:
+            pending.append((relpath, st))
+
+    if pending:
+        paths = [os.path.join(root, relpath) for relpath, st in pending]
+        if jobs == 1:
+            results = [compress_file(path, blob_dir, level) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(compress_file, paths,
+                                            [blob_dir] * len(paths), [level] * len(paths)))
+        for (relpath, st), result in zip(pending, results):
+            entries[relpath] = dict(result, mtime_ns=st.st_mtime_ns, mode=st.st_mode)
+
+    save_cache(cache_dir, level, {
+        relpath: {key: value for key, value in entry.items() if key != 'mode'}
+        for relpath, entry in entries.items()
+    })
+
+    # Mark the blobs in use, then drop finished blobs nobody has used for a
+    # while. Temp files of a concurrent build don't match BLOB_NAME.
+    live = {f"{entry['sha256']}-{level}" for entry in entries.values()}
+    for blob in live:
+        os.utime(os.path.join(blob_dir, blob))
+    expired = time.time() - CACHE_MAX_AGE
+    for blob in os.listdir(blob_dir):
+        blob_path = os.path.join(blob_dir, blob)
+        if blob not in live and BLOB_NAME.match(blob) and os.path.getmtime(blob_path) < expired:
+            os.remove(blob_path)
+
+    return [(relpath, entries[relpath]) for relpath in files], len(pending)
+
+
+def dos_datetime(timestamp):
+    """Convert a UNIX timestamp to ZIP (DOS) date and time fields"""
+    # ZIP format doesn't accept dates before 1980
+    dt = datetime.fromtimestamp(max(timestamp, 315532800), tz=timezone.utc)
+    dos_time = (dt.hour << 11) | (dt.minute << 5) | (dt.second // 2)
+    dos_date = ((dt.year - 1980) << 9) | (dt.month << 5) | dt.day
+    return dos_time, dos_date
+
+
+def write_archive(output, entries, blob_dir, level, timestamp):
+    """Write precompressed entries into a ZIP file, streaming each blob in chunks"""
+    dos_time, dos_date = dos_datetime(timestamp)
+    if len(entries) > 0xFFFF:
+        raise ValueError('Too many files for a non-ZIP64 archive')
+
+    tmp_output = output + '.tmp'
+    central = []
+    with open(tmp_output, 'wb') as out:
+        for relpath, entry in entries:
+            name = relpath.encode('utf-8')
+            flags = UTF8_FLAG if not relpath.isascii() else 0
+            if max(entry['size'], entry['compress_size'], out.tell()) > 0xFFFFFFFF:
+                raise ValueError(f'{relpath} is too large for a non-ZIP64 archive')
+
+            offset = out.tell()
+            out.write(LOCAL_HEADER.pack(
+                b'PK\x03\x04', ZIP_VERSION, 0, flags, ZIP_DEFLATED, dos_time, dos_date,
+                entry['crc'], entry['compress_size'], entry['size'], len(name), 0
+            ))
+            out.write(name)
+            with open(os.path.join(blob_dir, f"{entry['sha256']}-{level}"), 'rb') as blob:
+                for chunk in iter(lambda: blob.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+
+            # Normalise permissions so the archive doesn't depend on the umask
+            mode = 0o755 if entry['mode'] & stat.S_IXUSR else 0o644
+            central.append(CENTRAL_HEADER.pack(
+                b'PK\x01\x02', ZIP_VERSION, UNIX_SYSTEM, ZIP_VERSION, 0, flags, ZIP_DEFLATED,
+                dos_time, dos_date, entry['crc'], entry['compress_size'], entry['size'],
+                len(name), 0, 0, 0, 0, (stat.S_IFREG | mode) << 16, offset
+            ) + name)
+
+        central_offset = out.tell()
+        for record in central:
+            out.write(record)
+        central_size = out.tell() - central_offset
+        if central_offset + central_size > 0xFFFFFFFF:
+            raise ValueError('Archive is too large for a non-ZIP64 archive')
+
+        out.write(END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, len(central), len(central), central_size, central_offset, 0
+        ))
+
+    os.replace(tmp_output, output)
+
+
+def build(root='.', output=DEFAULT_OUTPUT, manifest=DEFAULT_MANIFEST, jobs=None, level=9):
+    """Build the deployment archive and return (file count, recompressed count)"""
+    root = os.path.abspath(root)
+    manifest_path = os.path.join(root, manifest) if manifest else None
+    cache_dir = os.path.join(root, CACHE_DIR)
+    # SOURCE_DATE_EPOCH is the usual convention for reproducible build timestamps
+    timestamp = int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+
+    files = collect_files(root, manifest_path, output)
+    entries, compressed = prepare_entries(root, files, cache_dir, level, jobs or os.cpu_count() or 1)
+    write_archive(output, entries, os.path.join(cache_dir, 'blobs'), level, timestamp)
+    return len(entries), compressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the deployment archive.')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help='archive to write')
+    parser.add_argument('-m', '--manifest', default=DEFAULT_MANIFEST,
+                        help='include manifest; ignored if the file does not exist')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='compression processes (default: all cores)')
+    parser.add_argument('-l', '--level', type=int, default=9, choices=range(0, 10), help='deflate level')
+    parser.add_argument('--root', default='.', help='project directory to package')
+    args = parser.parse_args(argv)
+
+    count, compressed = build(args.root, args.output, args.manifest, args.jobs, args.level)
+    print(f"ZIP file created successfully: {args.output}")
+    print(f"{count} files packaged, {compressed} compressed, {count - compressed} reused from cache.")
+    return 0
+
 
 if __name__ == '__main__':
-    zipf = zipfile.ZipFile('vehicle_booking.zip', 'w')
-    zipdir('.', zipf)
-    zipf.close()
-    
-    print("ZIP file created successfully: vehicle_booking.zip")
-    print("You can now download this file from the file explorer.")
-    print("Look for the file in the file list on the left side of your screen.")
\ No newline at end of file
+    sys.exit(main())
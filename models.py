@@ -33,6 +33,34 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
+class Depot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    address = db.Column(db.String(200))
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    # Grid cell of the depot, used as a spatial index for radius searches
+    cell_x = db.Column(db.Integer, nullable=False)
+    cell_y = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    vehicles = db.relationship('Vehicle', backref='depot', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_depot_cell', 'cell_x', 'cell_y'),
+    )
+    
+    def set_location(self, latitude, longitude):
+        from utils import grid_cell
+        self.latitude = latitude
+        self.longitude = longitude
+        self.cell_x, self.cell_y = grid_cell(latitude, longitude)
+    
+    def __repr__(self):
+        return f'<Depot {self.name}>'
+
+
 class Vehicle(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     make = db.Column(db.String(64), nullable=False)
@@ -46,12 +74,17 @@ class Vehicle(db.Model):
     is_available = db.Column(db.Boolean, default=True)
     description = db.Column(db.Text)
     features = db.Column(db.Text)  # Comma-separated list of features
+    depot_id = db.Column(db.Integer, db.ForeignKey('depot.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     bookings = db.relationship('Booking', backref='vehicle', lazy=True, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        db.Index('ix_vehicle_depot_available', 'depot_id', 'is_available'),
+    )
+    
     def __repr__(self):
         return f'<Vehicle {self.make} {self.model} ({self.year})>'
 
@@ -66,8 +99,20 @@ class Booking(db.Model):
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, completed, cancelled
     payment_info = db.Column(db.Text)  # JSON string with payment details
     notes = db.Column(db.Text)
+    pickup_depot_id = db.Column(db.Integer, db.ForeignKey('depot.id'))
+    return_depot_id = db.Column(db.Integer, db.ForeignKey('depot.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Relationships
+    pickup_depot = db.relationship('Depot', foreign_keys=[pickup_depot_id])
+    return_depot = db.relationship('Depot', foreign_keys=[return_depot_id])
+    
+    # Availability lookups go vehicle -> overlapping active bookings, so keep
+    # them on one index scoped to the vehicles of the depots being searched
+    __table_args__ = (
+        db.Index('ix_booking_vehicle_status_dates', 'vehicle_id', 'status', 'start_date', 'end_date'),
+    )
+    
     def __repr__(self):
         return f'<Booking {self.id}: {self.status}>'
@@ -0,0 +1,307 @@
+import math
+import time
+import uuid
+import logging
+import threading
+from collections import defaultdict, OrderedDict
+
+from flask import request, make_response
+from flask_login import current_user
+
+
+logger = logging.getLogger(__name__)
+
+# Per-route limits, keyed by endpoint name. Rates are "<count>/<period>" strings;
+# "ip" limits apply to every client, "user" limits only to logged-in users.
+# "methods" restricts the limit to the given HTTP methods and "require_args"
+# only applies it when all of the listed query/form parameters are present.
+DEFAULT_ROUTE_LIMITS = {
+    'login': {'ip': '10/minute', 'methods': ['POST']},
+    'register': {'ip': '5/minute', 'methods': ['POST']},
+    'book_vehicle': {'ip': '20/minute', 'user': '10/minute', 'methods': ['POST']},
+    'vehicles': {'ip': '30/minute', 'user': '30/minute', 'require_args': ['start_date', 'end_date']},
+}
+
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+# Atomic token bucket for the Redis backend. Returns {allowed, retry_after}.
+# A negative cost refunds tokens, up to the bucket's capacity.
+REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    tokens = math.min(capacity, tokens - cost)
+    allowed = 1
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+# Concurrency slots shared by all workers: a sorted set of in-flight request
+# tokens scored by start time. Slots older than the timeout are reclaimed, so
+# a worker that dies mid-request can't leak them forever.
+REDIS_ACQUIRE_SLOT = """
+local now = tonumber(ARGV[1])
+local timeout = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(timeout) + 1)
+return 1
+"""
+
+
+def parse_rate(rate):
+    """Parse a "<count>/<period>" string into (capacity, tokens per second)"""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    period = period.strip().rstrip('s') or 'second'
+    if count <= 0:
+        raise ValueError(f'Rate limit count must be positive: {rate}')
+    if period not in PERIODS:
+        raise ValueError(f'Unknown rate limit period: {rate}')
+    return count, count / PERIODS[period]
+
+
+class MemoryStore:
+    """In-process token bucket store, shared by all threads of one worker.
+
+    Holds at most max_keys buckets and evicts the least recently used one
+    when full; an evicted client just starts again with a full bucket.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.slots = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate, cost=1):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+
+            if tokens >= cost:
+                allowed, retry_after = True, 0
+                # A negative cost refunds tokens, up to the bucket's capacity
+                tokens = min(capacity, tokens - cost)
+            else:
+                allowed, retry_after = False, (cost - tokens) / rate
+
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+    def acquire_slot(self, name, limit, timeout):
+        # Only counts requests in this process; use Redis to cap across workers
+        with self.lock:
+            if self.slots[name] >= limit:
+                return None
+            self.slots[name] += 1
+        return name
+
+    def release_slot(self, name, token):
+        with self.lock:
+            self.slots[name] -= 1
+
+
+class RedisStore:
+    """Token bucket store backed by any server speaking the Redis protocol"""
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        # from_url doesn't connect, so check the server is really there
+        self.client.ping()
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET)
+        self.acquire_script = self.client.register_script(REDIS_ACQUIRE_SLOT)
+        self.prefix = prefix
+
+    def consume(self, key, capacity, rate, cost=1):
+        allowed, retry_after = self.script(
+            keys=[self.prefix + key],
+            args=[capacity, rate, time.time(), cost]
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def acquire_slot(self, name, limit, timeout):
+        token = uuid.uuid4().hex
+        acquired = self.acquire_script(
+            keys=[self.prefix + name],
+            args=[time.time(), timeout, limit, token]
+        )
+        return token if int(acquired) else None
+
+    def release_slot(self, name, token):
+        self.client.zrem(self.prefix + name, token)
+
+
+class RateLimiter:
+    """Per-route token buckets plus a global concurrency cap for the app"""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.fallback = MemoryStore()
+        self.storage_retry_at = 0
+        self.routes = {}
+        self.max_concurrent = 0
+        self.enabled = True
+        self.counters = defaultdict(lambda: {'allowed': 0, 'limited': 0})
+        self.shed = 0
+        self.counter_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATELIMIT_STORAGE_RETRY', 30)
+        app.config.setdefault('RATELIMIT_ROUTES', DEFAULT_ROUTE_LIMITS)
+        app.config.setdefault('RATELIMIT_MAX_CONCURRENT', 0)
+        app.config.setdefault('RATELIMIT_CONCURRENCY_EXEMPT', ['static', 'admin_rate_limits'])
+        app.config.setdefault('RATELIMIT_SLOT_TIMEOUT', 60)
+        app.config.setdefault('RATELIMIT_SHED_RETRY_AFTER', 1)
+
+        self.enabled = app.config['RATELIMIT_ENABLED']
+        self.store = self._create_store(app.config['RATELIMIT_STORAGE_URL'])
+        self.storage_retry = app.config['RATELIMIT_STORAGE_RETRY']
+        self.routes = {}
+        for endpoint, limits in app.config['RATELIMIT_ROUTES'].items():
+            self.routes[endpoint] = {
+                'ip': parse_rate(limits['ip']) if limits.get('ip') else None,
+                'user': parse_rate(limits['user']) if limits.get('user') else None,
+                'methods': set(limits.get('methods') or []),
+                'require_args': list(limits.get('require_args') or []),
+            }
+
+        self.max_concurrent = app.config['RATELIMIT_MAX_CONCURRENT']
+        self.concurrency_exempt = set(app.config['RATELIMIT_CONCURRENCY_EXEMPT'])
+        self.slot_timeout = app.config['RATELIMIT_SLOT_TIMEOUT']
+        self.shed_retry_after = app.config['RATELIMIT_SHED_RETRY_AFTER']
+
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.extensions['ratelimit'] = self
+
+    def _create_store(self, url):
+        if url:
+            try:
+                return RedisStore(url)
+            except ImportError:
+                logger.warning("RATELIMIT_STORAGE_URL is set but redis is not installed "
+                               "(install the 'redis' extra), using memory")
+            except Exception as e:
+                logger.warning(f"Rate limit storage {url} unavailable, using memory: {e}")
+        return self.fallback
+
+    def before_request(self):
+        if not self.enabled:
+            return None
+
+        # Shed load before the request reaches the database. Static files and
+        # unknown URLs never touch it, so they don't take a slot.
+        if (self.max_concurrent and request.endpoint is not None
+                and request.endpoint not in self.concurrency_exempt):
+            store, token = self._call_store('acquire_slot', 'inflight', self.max_concurrent, self.slot_timeout)
+            if token is None:
+                with self.counter_lock:
+                    self.shed += 1
+                return self._reject('Server is busy, please try again shortly.', 503, self.shed_retry_after)
+            request.environ['ratelimit.slot'] = (store, token)
+
+        limits = self.routes.get(request.endpoint)
+        if not limits or not self._applies(limits):
+            return None
+
+        keys = [('ip', f"{request.endpoint}:ip:{request.remote_addr}")]
+        if current_user.is_authenticated:
+            keys.append(('user', f"{request.endpoint}:user:{current_user.id}"))
+
+        charged = []
+        for scope, key in keys:
+            if not limits[scope]:
+                continue
+            capacity, rate = limits[scope]
+            store, (allowed, retry_after) = self._call_store('consume', key, capacity, rate)
+            if not allowed:
+                # Give back tokens already taken for this request, so a user hitting
+                # their own limit doesn't drain the IP budget shared behind a NAT
+                for charged_key, charged_capacity, charged_rate in charged:
+                    self._call_store('consume', charged_key, charged_capacity, charged_rate, -1)
+                self._count(request.endpoint, 'limited')
+                return self._reject('Too many requests, please slow down.', 429, retry_after)
+            charged.append((key, capacity, rate))
+
+        self._count(request.endpoint, 'allowed')
+        return None
+
+    def _call_store(self, method, *args):
+        """Call a store method, returning (store used, result)"""
+        # While the shared store is down, limit per worker rather than not at all,
+        # and only retry the store every storage_retry seconds
+        if self.store is not self.fallback and time.monotonic() >= self.storage_retry_at:
+            try:
+                return self.store, getattr(self.store, method)(*args)
+            except Exception as e:
+                logger.error(f"Rate limit storage failed, using memory for {self.storage_retry}s: {e}")
+                self.storage_retry_at = time.monotonic() + self.storage_retry
+        return self.fallback, getattr(self.fallback, method)(*args)
+
+    def teardown_request(self, exc=None):
+        slot = request.environ.pop('ratelimit.slot', None)
+        if slot is None:
+            return
+        store, token = slot
+        try:
+            store.release_slot('inflight', token)
+        except Exception as e:
+            # The slot times out on its own after slot_timeout seconds
+            logger.error(f"Failed to release concurrency slot: {e}")
+
+    def _applies(self, limits):
+        if limits['methods'] and request.method not in limits['methods']:
+            return False
+        for arg in limits['require_args']:
+            if not (request.args.get(arg) or request.form.get(arg)):
+                return False
+        return True
+
+    def _count(self, endpoint, outcome):
+        with self.counter_lock:
+            self.counters[endpoint][outcome] += 1
+
+    def _reject(self, message, status, retry_after):
+        response = make_response(message, status)
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def stats(self):
+        """Return limiter hit counters for this worker process"""
+        with self.counter_lock:
+            return {
+                'routes': {endpoint: dict(counts) for endpoint, counts in self.counters.items()},
+                'shed': self.shed,
+            }
@@ -2,14 +2,16 @@ import json
 from datetime import datetime, timedelta
 from flask import render_template, url_for, flash, redirect, request, session, jsonify
 from flask_login import login_user, current_user, logout_user, login_required
-from sqlalchemy import or_, and_
-from app import db
-from models import User, Vehicle, Booking
+from app import db, limiter
+from models import User, Vehicle, Booking, Depot
 from forms import (
     RegistrationForm, LoginForm, VehicleForm, BookingForm, 
-    SearchForm, BookingStatusForm
+    SearchForm, BookingStatusForm, DepotForm, depot_choices
+)
+from utils import (
+    calculate_booking_price, is_vehicle_available, find_depots_within,
+    get_unavailable_vehicle_ids, parse_search_radius, parse_coordinates
 )
-from utils import calculate_booking_price, is_vehicle_available
 
 
 def register_routes(app):
@@ -70,6 +72,7 @@ def register_routes(app):
     @app.route('/vehicles', methods=['GET', 'POST'])
     def vehicles():
         form = SearchForm()
+        form.depot_id.choices = depot_choices('Any Depot')
         
         # Get all vehicles by default
         query = Vehicle.query.filter_by(is_available=True)
@@ -90,6 +93,26 @@ def register_routes(app):
                 
             if data.get('capacity'):
                 query = query.filter(Vehicle.capacity >= int(data.get('capacity')))
+            
+            # Limit the search to depots within a radius of a point or depot
+            depot_ids = None
+            center = None
+            if data.get('latitude') and data.get('longitude'):
+                center = parse_coordinates(data.get('latitude'), data.get('longitude'))
+                if center is None:
+                    flash('Invalid search location.', 'danger')
+            elif data.get('depot_id'):
+                depot = Depot.query.get(int(data.get('depot_id')))
+                if depot:
+                    center = (depot.latitude, depot.longitude)
+            
+            if center:
+                radius = parse_search_radius(data.get('radius'))
+                if radius is None:
+                    flash('Invalid search radius.', 'danger')
+                    radius = 0
+                depot_ids = [depot.id for depot in find_depots_within(center[0], center[1], radius)]
+                query = query.filter(Vehicle.depot_id.in_(depot_ids))
                 
             # If dates are provided, check availability
             if data.get('start_date') and data.get('end_date'):
@@ -100,19 +123,8 @@ def register_routes(app):
                 session['start_date'] = start_date.strftime('%Y-%m-%d')
                 session['end_date'] = end_date.strftime('%Y-%m-%d')
                 
-                # Find unavailable vehicles during this period
-                unavailable_bookings = Booking.query.filter(
-                    and_(
-                        Booking.status.in_(['pending', 'confirmed']),
-                        or_(
-                            and_(Booking.start_date <= start_date, Booking.end_date >= start_date),
-                            and_(Booking.start_date <= end_date, Booking.end_date >= end_date),
-                            and_(Booking.start_date >= start_date, Booking.end_date <= end_date)
-                        )
-                    )
-                ).all()
-                
-                unavailable_vehicle_ids = [booking.vehicle_id for booking in unavailable_bookings]
+                # Find unavailable vehicles during this period, only among local depots
+                unavailable_vehicle_ids = get_unavailable_vehicle_ids(start_date, end_date, depot_ids)
                 if unavailable_vehicle_ids:
                     query = query.filter(~Vehicle.id.in_(unavailable_vehicle_ids))
         
@@ -135,6 +147,13 @@ def register_routes(app):
         
         form = BookingForm()
         form.vehicle_id.data = vehicle.id
+        form.pickup_depot_id.choices = depot_choices('No Preference')
+        form.return_depot_id.choices = depot_choices('No Preference')
+        
+        # Default pickup and return to the vehicle's own depot
+        if request.method == 'GET' and vehicle.depot_id:
+            form.pickup_depot_id.data = vehicle.depot_id
+            form.return_depot_id.data = vehicle.depot_id
         
         # Pre-fill dates from session if available
         if session.get('start_date') and session.get('end_date'):
@@ -169,7 +188,9 @@ def register_routes(app):
                 total_price=total_price,
                 status='pending',
                 payment_info=payment_info,
-                notes=form.notes.data
+                notes=form.notes.data,
+                pickup_depot_id=form.pickup_depot_id.data or vehicle.depot_id,
+                return_depot_id=form.return_depot_id.data or vehicle.depot_id
             )
             
             db.session.add(booking)
@@ -247,6 +268,7 @@ def register_routes(app):
             return redirect(url_for('index'))
         
         form = VehicleForm()
+        form.depot_id.choices = depot_choices('No Depot')
         if form.validate_on_submit():
             vehicle = Vehicle(
                 make=form.make.data,
@@ -259,7 +281,8 @@ def register_routes(app):
                 daily_rate=form.daily_rate.data,
                 is_available=form.is_available.data,
                 description=form.description.data,
-                features=form.features.data
+                features=form.features.data,
+                depot_id=form.depot_id.data or None
             )
             
             db.session.add(vehicle)
@@ -279,9 +302,11 @@ def register_routes(app):
         
         vehicle = Vehicle.query.get_or_404(vehicle_id)
         form = VehicleForm(obj=vehicle)
+        form.depot_id.choices = depot_choices('No Depot')
         
         if form.validate_on_submit():
             form.populate_obj(vehicle)
+            vehicle.depot_id = form.depot_id.data or None
             db.session.commit()
             
             flash('Vehicle has been updated successfully.', 'success')
@@ -309,6 +334,27 @@ def register_routes(app):
         flash('Vehicle has been deleted successfully.', 'success')
         return redirect(url_for('admin_vehicles'))
 
+    @app.route('/admin/depots', methods=['GET', 'POST'])
+    @login_required
+    def admin_depots():
+        if not current_user.is_admin:
+            flash('Access denied. You must be an administrator.', 'danger')
+            return redirect(url_for('index'))
+        
+        form = DepotForm()
+        if form.validate_on_submit():
+            depot = Depot(name=form.name.data, address=form.address.data)
+            depot.set_location(form.latitude.data, form.longitude.data)
+            
+            db.session.add(depot)
+            db.session.commit()
+            
+            flash('Depot has been added successfully.', 'success')
+            return redirect(url_for('admin_depots'))
+        
+        depots = Depot.query.order_by(Depot.name).all()
+        return render_template('admin/manage_depots.html', title='Manage Depots', form=form, depots=depots)
+
     @app.route('/admin/bookings')
     @login_required
     def admin_bookings():
@@ -385,6 +431,15 @@ def register_routes(app):
                                monthly_revenue=monthly_revenue,
                                vehicle_bookings=vehicle_bookings)
 
+    @app.route('/admin/rate-limits')
+    @login_required
+    def admin_rate_limits():
+        if not current_user.is_admin:
+            flash('Access denied. You must be an administrator.', 'danger')
+            return redirect(url_for('index'))
+        
+        return jsonify(limiter.stats())
+
     # Error handlers
     @app.errorhandler(404)
     def page_not_found(e):
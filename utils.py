@@ -1,9 +1,14 @@
 import math
+import logging
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateColumn
 from app import db
 
+logger = logging.getLogger(__name__)
+
 def calculate_booking_price(daily_rate, start_date, end_date):
     """Calculate the total price for a booking"""
     # Calculate number of days
@@ -45,6 +50,162 @@ def is_vehicle_available(vehicle_id, start_date, end_date):
     return len(conflicting_bookings) == 0
 
 
+# Size of a spatial grid cell in degrees (roughly 28 km of latitude)
+GRID_CELL_DEGREES = 0.25
+EARTH_RADIUS_KM = 6371.0
+# Half the Earth's circumference: no point is further away than this
+MAX_SEARCH_RADIUS_KM = math.pi * EARTH_RADIUS_KM
+
+
+def grid_cell(latitude, longitude):
+    """Return the (x, y) grid cell containing a coordinate"""
+    return (int(math.floor(longitude / GRID_CELL_DEGREES)),
+            int(math.floor(latitude / GRID_CELL_DEGREES)))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def parse_search_radius(value):
+    """Parse a search radius in km, capped to MAX_SEARCH_RADIUS_KM; None if invalid"""
+    try:
+        radius = float(value or 0)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(radius) or radius < 0:
+        return None
+    return min(radius, MAX_SEARCH_RADIUS_KM)
+
+
+def parse_coordinates(latitude, longitude):
+    """Parse a latitude/longitude pair, returning None if it isn't a valid location"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def find_depots_within(latitude, longitude, radius_km):
+    """Find depots within a radius of a point, nearest first"""
+    from models import Depot
+    
+    radius_km = min(radius_km, MAX_SEARCH_RADIUS_KM)
+    
+    # Bounding box of the search circle, in grid cells
+    lat_delta = radius_km / 111.32
+    lon_delta = radius_km / (111.32 * max(math.cos(math.radians(latitude)), 0.01))
+    min_x, min_y = grid_cell(max(latitude - lat_delta, -90), longitude - lon_delta)
+    max_x, max_y = grid_cell(min(latitude + lat_delta, 90), longitude + lon_delta)
+    query = Depot.query.filter(Depot.cell_y.between(min_y, max_y))
+    
+    # Split the longitude range in two where it wraps around +/-180 degrees.
+    # Circles reaching a pole or wider than the globe cover every longitude.
+    west_x, _ = grid_cell(0, -180)
+    east_x, _ = grid_cell(0, 180 - 1e-9)
+    if lon_delta < 180 and abs(latitude) + lat_delta < 90:
+        if longitude - lon_delta < -180:
+            wrapped_x, _ = grid_cell(0, longitude - lon_delta + 360)
+            query = query.filter(or_(Depot.cell_x.between(west_x, max_x),
+                                     Depot.cell_x.between(wrapped_x, east_x)))
+        elif longitude + lon_delta >= 180:
+            wrapped_x, _ = grid_cell(0, longitude + lon_delta - 360)
+            query = query.filter(or_(Depot.cell_x.between(min_x, east_x),
+                                     Depot.cell_x.between(west_x, wrapped_x)))
+        else:
+            query = query.filter(Depot.cell_x.between(min_x, max_x))
+    
+    # Use the cell index to narrow candidates, then filter on exact distance
+    candidates = query.all()
+    
+    depots = []
+    for depot in candidates:
+        distance = haversine_km(latitude, longitude, depot.latitude, depot.longitude)
+        if distance <= radius_km:
+            depots.append((distance, depot))
+    
+    return [depot for distance, depot in sorted(depots, key=lambda item: item[0])]
+
+
+def get_unavailable_vehicle_ids(start_date, end_date, depot_ids=None):
+    """Return ids of vehicles booked during a date range, optionally limited to some depots"""
+    from models import Booking, Vehicle
+    
+    query = db.session.query(Booking.vehicle_id).filter(
+        Booking.status.in_(['pending', 'confirmed']),
+        Booking.start_date <= end_date,
+        Booking.end_date >= start_date
+    )
+    
+    # Only scan bookings for vehicles based at the searched depots
+    if depot_ids is not None:
+        local_vehicles = db.session.query(Vehicle.id).filter(Vehicle.depot_id.in_(depot_ids))
+        query = query.filter(Booking.vehicle_id.in_(local_vehicles))
+    
+    return [vehicle_id for (vehicle_id,) in query.distinct()]
+
+
+def upgrade_schema():
+    """Add columns and indexes missing from tables created by older versions"""
+    # db.create_all() only creates missing tables, it never alters existing ones
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    preparer = dialect.identifier_preparer
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            # Existing rows need a value, so NOT NULL columns must come with a server default
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} "
+                                   f"without a server_default; migrate it by hand")
+            
+            ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {CreateColumn(column).compile(dialect=dialect)}"
+            for foreign_key in column.foreign_keys:
+                target = foreign_key.column
+                ddl += f" REFERENCES {preparer.format_table(target.table)} ({preparer.format_column(target)})"
+            _run_upgrade_step(
+                lambda connection: connection.execute(text(ddl)),
+                lambda: column.name in {c['name'] for c in inspect(db.engine).get_columns(table.name)},
+                f"column {table.name}.{column.name}"
+            )
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+            _run_upgrade_step(
+                lambda connection: index.create(connection),
+                lambda: index.name in {i['name'] for i in inspect(db.engine).get_indexes(table.name)},
+                f"index {index.name}"
+            )
+
+
+def _run_upgrade_step(apply, is_done, description):
+    # Every worker runs the upgrade at startup, so another one may get there first
+    try:
+        with db.engine.begin() as connection:
+            apply(connection)
+    except SQLAlchemyError:
+        if not is_done():
+            raise
+        logger.info(f"Schema upgrade: {description} was added by another process")
+    else:
+        logger.info(f"Schema upgrade: added {description}")
+
+
 def initialize_admin():
     """Create admin user if it doesn't exist"""
     from models import User